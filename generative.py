@@ -1,11 +1,19 @@
 import streamlit as st
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure, SubplotParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import random
 import math
+import io
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import json
-from collections import Counter
+from collections import Counter, OrderedDict, deque
 
 # EXPANDED emotion palettes with more emotions and refined colors
 EMOTION_PALETTES = {
@@ -114,7 +122,136 @@ def ascending_shape(center, size):
     y = center[1] + size * np.sin(t) + t/10
     return x, y
 
-def generate_emotion_art(emotion, date_str, note="", intensity=5, weather="", activities=[], seed=None):
+# Figure sizes used by the render paths (also the figure pool buckets)
+ART_FIGSIZE = (7, 9)
+MOOD_CHART_FIGSIZE = (10, 4)
+
+# Cached renders per session: gallery thumbnails are rasterised small and only the
+# most recently shown ones are kept
+THUMBNAIL_DPI = 60
+RENDER_CACHE_SIZE = 60
+
+def new_figure(figsize):
+    """Agg-backed figure that never enters pyplot's global registry"""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+class FigurePool:
+    """Reusable figures bucketed by size, shared by every session of the server
+    
+    Each borrowed figure is tracked with its acquire time. A render holds a figure
+    for well under a second, so a borrow older than stale_after was never returned.
+    """
+    def __init__(self, max_idle=4, stale_after=30):
+        self.max_idle = max_idle
+        self.stale_after = stale_after
+        self._idle = {}
+        self._borrowed = {}
+        self._lock = threading.Lock()
+    
+    def acquire(self, figsize):
+        with self._lock:
+            bucket = self._idle.get(figsize)
+            fig = bucket.pop() if bucket else None
+        if fig is None:
+            fig = new_figure(figsize)
+        with self._lock:
+            self._borrowed[id(fig)] = time.monotonic()
+        return fig
+    
+    def release(self, figsize, fig):
+        # Wipe artists and undo any tight_layout so the next borrower starts clean
+        fig.clear()
+        defaults = SubplotParams()
+        fig.subplotpars.update(left=defaults.left, bottom=defaults.bottom,
+                               right=defaults.right, top=defaults.top,
+                               wspace=defaults.wspace, hspace=defaults.hspace)
+        with self._lock:
+            self._borrowed.pop(id(fig), None)
+            bucket = self._idle.setdefault(figsize, [])
+            if len(bucket) < self.max_idle:
+                bucket.append(fig)
+    
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {"in_use": len(self._borrowed),
+                    "unreturned": sum(1 for t in self._borrowed.values() if now - t > self.stale_after),
+                    "idle": sum(len(b) for b in self._idle.values())}
+
+@st.cache_resource
+def get_figure_pool():
+    return FigurePool()
+
+@contextmanager
+def render_figure(figsize):
+    """Borrow a pooled figure; it is returned even if the render raises or calls st.rerun()"""
+    pool = get_figure_pool()
+    fig = pool.acquire(figsize)
+    try:
+        yield fig
+    finally:
+        pool.release(figsize, fig)
+
+def current_rss_mb():
+    """Resident memory of this process in MB, None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, None where it can't be read"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux/BSD
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+class RenderWatchdog:
+    """Samples open figure counts and RSS across reruns so leaks show up over time"""
+    def __init__(self, max_samples=120):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+    
+    def sample(self, pool):
+        record = {
+            "time": time.time(),
+            "pyplot_figures": len(plt.get_fignums()),
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            **pool.stats()
+        }
+        with self._lock:
+            self._samples.append(record)
+        return record
+    
+    def history(self):
+        with self._lock:
+            return list(self._samples)
+    
+    def leak_suspected(self):
+        """Figures left in pyplot's registry, or pooled figures that never came back
+        
+        Uses unreturned borrows rather than the in-use count, which also includes
+        renders running right now in other sessions.
+        """
+        history = self.history()
+        if not history:
+            return False
+        latest = history[-1]
+        return latest["pyplot_figures"] > 0 or latest["unreturned"] > 0
+
+@st.cache_resource
+def get_render_watchdog():
+    return RenderWatchdog()
+
+def generate_emotion_art(emotion, date_str, note="", intensity=5, weather="", activities=[], seed=None, fig=None):
     """Enhanced art generation with more parameters"""
     if seed is None:
         seed = hash(date_str + emotion) % 10000
@@ -122,7 +259,9 @@ def generate_emotion_art(emotion, date_str, note="", intensity=5, weather="", ac
     random.seed(seed)
     np.random.seed(seed)
     
-    fig, ax = plt.subplots(figsize=(7, 9))
+    if fig is None:
+        fig = new_figure(ART_FIGSIZE)
+    ax = fig.subplots()
     ax.axis('off')
     
     # Dynamic background based on intensity
@@ -181,7 +320,7 @@ def generate_emotion_art(emotion, date_str, note="", intensity=5, weather="", ac
     
     return fig
 
-def generate_mood_chart(entries):
+def generate_mood_chart(entries, fig=None):
     """Create mood tracking chart"""
     if not entries:
         return None
@@ -213,7 +352,9 @@ def generate_mood_chart(entries):
         intensities.append(intensity)
         labels.append(date[5:])  # MM-DD
     
-    fig, ax = plt.subplots(figsize=(10, 4))
+    if fig is None:
+        fig = new_figure(MOOD_CHART_FIGSIZE)
+    ax = fig.subplots()
     
     # Create gradient effect
     for i in range(len(values)):
@@ -230,9 +371,14 @@ def generate_mood_chart(entries):
     ax.grid(axis='y', alpha=0.3, linestyle='--')
     ax.set_facecolor('#f8f9fa')
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
+def mood_chart_key(entries):
+    """The (date, emotion, intensity) values the mood chart draws"""
+    return tuple((date, entries[date].get('emotion'), entries[date].get('intensity'))
+                 for date in sorted(entries.keys())[-14:])
+
 def get_emotion_insights(entries):
     """Generate insights from emotion data"""
     if not entries:
@@ -269,6 +415,113 @@ def get_emotion_insights(entries):
         "total": len(entries)
     }
 
+def parse_timestamp(value):
+    """Entry timestamp as a naive local datetime, None when missing or malformed"""
+    try:
+        ts = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+def is_valid_entry(entry):
+    """Whether an imported value is an entry the views can render"""
+    if not isinstance(entry, dict) or not isinstance(entry.get('emotion'), str):
+        return False
+    # bool is an int subclass; the slider only ever produces 1-10
+    intensity = entry.get('intensity')
+    if isinstance(intensity, bool) or not isinstance(intensity, int) or not 1 <= intensity <= 10:
+        return False
+    if not isinstance(entry.get('note', ''), str) or not isinstance(entry.get('weather', ''), str):
+        return False
+    activities = entry.get('activities', [])
+    return isinstance(activities, list) and all(isinstance(a, str) for a in activities)
+
+def normalize_entry(entry):
+    """Imported entry with the optional fields the views read filled in"""
+    return {'note': '', 'weather': '', 'activities': [], **entry}
+
+def merge_entries(stored, incoming):
+    """Diff imported entries against stored ones by date, last writer wins
+    
+    Returns (changes, overwritten, kept_local, invalid): the entries to write keyed by
+    date, then the conflicting dates - both sides differ - where the newer incoming entry
+    replaces the local one, and where the incoming entry isn't newer so the local one is
+    kept, and finally the dates whose incoming value isn't a usable entry and was skipped.
+    """
+    changes = {}
+    overwritten = []
+    kept_local = []
+    invalid = []
+    
+    for date, entry in incoming.items():
+        if not is_valid_entry(entry):
+            invalid.append(date)
+            continue
+        entry = normalize_entry(entry)
+        
+        current = stored.get(date)
+        if current is None:
+            changes[date] = entry
+            continue
+        if current == entry:
+            continue
+        
+        current_ts = parse_timestamp(current.get('timestamp'))
+        incoming_ts = parse_timestamp(entry.get('timestamp'))
+        # Entries without a timestamp can't win against one that has it
+        if current_ts is None or (incoming_ts is not None and incoming_ts > current_ts):
+            changes[date] = entry
+            overwritten.append(date)
+        else:
+            kept_local.append(date)
+    
+    return changes, sorted(overwritten), sorted(kept_local), sorted(invalid)
+
+def summarize_dates(dates, limit=5):
+    """First few dates of a list, with a count of the rest"""
+    shown = ', '.join(dates[:limit])
+    return f"{shown} and {len(dates) - limit} more" if len(dates) > limit else shown
+
+def mark_entries_changed(dates=None):
+    """Bump the entries revision and drop cached renders for the changed dates (all when None)"""
+    st.session_state.entries_revision += 1
+    if dates is None:
+        st.session_state.render_cache.clear()
+    else:
+        for date in dates:
+            st.session_state.render_cache.pop(('thumbnail', date), None)
+
+def figure_to_png(fig, dpi=200):
+    """Rasterise a figure with the same settings st.pyplot uses"""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
+
+def cached_render(cache_key, render_key, figsize, draw, dpi=200):
+    """PNG for cache_key, redrawn only when render_key (the data it depends on) changes
+    
+    The cache is an LRU bounded by RENDER_CACHE_SIZE.
+    """
+    cache = st.session_state.render_cache
+    hit = cache.get(cache_key)
+    if hit is None or hit[0] != render_key:
+        with render_figure(figsize) as fig:
+            draw(fig)
+            hit = (render_key, figure_to_png(fig, dpi=dpi))
+        cache[cache_key] = hit
+    cache.move_to_end(cache_key)
+    while len(cache) > RENDER_CACHE_SIZE:
+        cache.popitem(last=False)
+    return hit[1]
+
+def get_cached_insights():
+    """Emotion insights, recomputed only when the entries have changed"""
+    cached = st.session_state.get('insights_cache')
+    if cached is None or cached[0] != st.session_state.entries_revision:
+        cached = (st.session_state.entries_revision, get_emotion_insights(st.session_state.entries))
+        st.session_state.insights_cache = cached
+    return cached[1]
+
 # Streamlit App Configuration
 st.set_page_config(page_title="MindCanvas - Emotion Diary", page_icon="🎨", layout="wide")
 
@@ -316,6 +569,12 @@ if 'entries' not in st.session_state:
     st.session_state.entries = {}
 if 'view_date' not in st.session_state:
     st.session_state.view_date = None
+if 'entries_revision' not in st.session_state:
+    st.session_state.entries_revision = 0
+if 'last_import_id' not in st.session_state:
+    st.session_state.last_import_id = None
+if 'render_cache' not in st.session_state:
+    st.session_state.render_cache = OrderedDict()
 
 # Tabs
 tab1, tab2, tab3, tab4 = st.tabs(["✨ Create Art", "📊 Analytics", "📅 Gallery", "💡 Insights"])
@@ -361,6 +620,7 @@ with tab1:
                     'activities': activities,
                     'timestamp': datetime.now().isoformat()
                 }
+                mark_entries_changed([date_str])
                 st.success("✨ Entry saved!")
                 st.rerun()
         
@@ -368,24 +628,25 @@ with tab1:
             if date_str in st.session_state.entries:
                 if st.button("🗑️ Delete Entry", use_container_width=True):
                     del st.session_state.entries[date_str]
+                    mark_entries_changed([date_str])
                     st.success("Entry deleted")
                     st.rerun()
     
     with col2:
         st.subheader("Your Emotion Art")
         
-        if date_str in st.session_state.entries:
-            entry = st.session_state.entries[date_str]
-            fig = generate_emotion_art(
-                entry['emotion'], date_str, entry['note'], 
-                entry['intensity'], entry.get('weather', ''),
-                entry.get('activities', [])
-            )
-        else:
-            fig = generate_emotion_art(emotion, date_str, note, intensity, weather, activities)
-        
-        st.pyplot(fig)
-        plt.close(fig)
+        with render_figure(ART_FIGSIZE) as fig:
+            if date_str in st.session_state.entries:
+                entry = st.session_state.entries[date_str]
+                generate_emotion_art(
+                    entry['emotion'], date_str, entry['note'], 
+                    entry['intensity'], entry.get('weather', ''),
+                    entry.get('activities', []), fig=fig
+                )
+            else:
+                generate_emotion_art(emotion, date_str, note, intensity, weather, activities, fig=fig)
+            
+            st.pyplot(fig)
         
         st.caption("💡 Each piece is unique - the patterns, colors, and shapes reflect your emotional state")
 
@@ -393,7 +654,7 @@ with tab2:
     st.header("Emotional Analytics")
     
     if len(st.session_state.entries) >= 2:
-        insights = get_emotion_insights(st.session_state.entries)
+        insights = get_cached_insights()
         
         # Metrics row
         col1, col2, col3, col4 = st.columns(4)
@@ -422,10 +683,11 @@ with tab2:
         
         # Mood chart
         st.subheader("📈 Mood Tracking (Last 14 Days)")
-        mood_fig = generate_mood_chart(st.session_state.entries)
-        if mood_fig:
-            st.pyplot(mood_fig)
-            plt.close(mood_fig)
+        mood_png = cached_render(
+            'mood_chart', mood_chart_key(st.session_state.entries), MOOD_CHART_FIGSIZE,
+            lambda fig: generate_mood_chart(st.session_state.entries, fig=fig)
+        )
+        st.image(mood_png, use_container_width=True)
         
         st.markdown("---")
         
@@ -491,13 +753,16 @@ with tab3:
                         st.markdown(f"**{date}**")
                         st.write(f"{entry['emotion']}")
                         
-                        # Generate thumbnail
-                        fig = generate_emotion_art(
-                            entry['emotion'], date, "", 
-                            entry['intensity'], "", []
+                        # Thumbnail - only redrawn when this date's entry changes
+                        thumbnail = cached_render(
+                            ('thumbnail', date), (entry['emotion'], entry['intensity']), ART_FIGSIZE,
+                            lambda fig: generate_emotion_art(
+                                entry['emotion'], date, "", 
+                                entry['intensity'], "", [], fig=fig
+                            ),
+                            dpi=THUMBNAIL_DPI
                         )
-                        st.pyplot(fig, use_container_width=True)
-                        plt.close(fig)
+                        st.image(thumbnail, use_container_width=True)
                         
                         if st.button("📖 View Details", key=f"view_{date}", use_container_width=True):
                             st.session_state.view_date = date
@@ -522,13 +787,14 @@ with tab3:
                     st.write(f"**Note:** {entry['note']}")
             
             with col2:
-                fig = generate_emotion_art(
-                    entry['emotion'], st.session_state.view_date,
-                    entry['note'], entry['intensity'],
-                    entry.get('weather', ''), entry.get('activities', [])
-                )
-                st.pyplot(fig)
-                plt.close(fig)
+                with render_figure(ART_FIGSIZE) as fig:
+                    generate_emotion_art(
+                        entry['emotion'], st.session_state.view_date,
+                        entry['note'], entry['intensity'],
+                        entry.get('weather', ''), entry.get('activities', []),
+                        fig=fig
+                    )
+                    st.pyplot(fig)
     else:
         st.info("🎨 No entries yet. Create your first emotion art!")
 
@@ -536,7 +802,7 @@ with tab4:
     st.header("💡 Wellbeing Insights")
     
     if len(st.session_state.entries) >= 5:
-        insights = get_emotion_insights(st.session_state.entries)
+        insights = get_cached_insights()
         
         st.subheader("Your Emotional Patterns")
         
@@ -667,14 +933,46 @@ with st.sidebar:
     
     # Import data
     uploaded_file = st.file_uploader("📤 Import Data", type=['json'])
-    if uploaded_file is not None:
+    # The uploader keeps its file across reruns - merge each upload only once so
+    # later deletes and clears aren't undone by re-importing the same file
+    if uploaded_file is not None and uploaded_file.file_id != st.session_state.last_import_id:
+        st.session_state.last_import_id = uploaded_file.file_id
         try:
             imported_data = json.loads(uploaded_file.read())
-            st.session_state.entries.update(imported_data)
-            st.success("✅ Data imported successfully!")
-            st.rerun()
+            if not isinstance(imported_data, dict):
+                raise ValueError("expected entries keyed by date")
+            
+            changes, overwritten, kept_local, invalid = merge_entries(st.session_state.entries, imported_data)
+            st.session_state.import_report = {
+                'imported': len(changes), 'overwritten': overwritten,
+                'kept_local': kept_local, 'invalid': invalid
+            }
+            if changes:
+                st.session_state.entries.update(changes)
+                mark_entries_changed(changes.keys())
+                st.rerun()
         except Exception as e:
-            st.error(f"❌ Error importing data: {str(e)}")
+            st.session_state.import_report = {'error': str(e)}
+    
+    # Shown once per upload, after the rerun that applied it
+    import_report = st.session_state.pop('import_report', None)
+    if import_report:
+        if 'error' in import_report:
+            st.error(f"❌ Error importing data: {import_report['error']}")
+        else:
+            if import_report['imported']:
+                st.success(f"✅ Imported {import_report['imported']} entries!")
+            else:
+                st.info("Already up to date")
+            overwritten = import_report['overwritten']
+            if overwritten:
+                st.warning(f"⚠️ Replaced {len(overwritten)} local entries with newer imported versions: {summarize_dates(overwritten)}")
+            kept_local = import_report['kept_local']
+            if kept_local:
+                st.warning(f"⚠️ Kept local version for {len(kept_local)} entries: {summarize_dates(kept_local)}")
+            invalid = import_report['invalid']
+            if invalid:
+                st.error(f"❌ Skipped {len(invalid)} malformed entries: {summarize_dates(invalid)}")
     
     st.markdown("---")
     
@@ -682,8 +980,35 @@ with st.sidebar:
         if st.session_state.entries:
             st.session_state.entries = {}
             st.session_state.view_date = None
+            mark_entries_changed()
             st.success("All data cleared")
             st.rerun()
+    
+    st.markdown("---")
+    
+    # Render health - sampled after this run's figures have been released
+    watchdog = get_render_watchdog()
+    health = watchdog.sample(get_figure_pool())
+    with st.expander("🩺 Render Health"):
+        col_a, col_b = st.columns(2)
+        col_a.metric("Open figures", health['pyplot_figures'] + health['in_use'])
+        if health['rss_mb'] is not None:
+            col_b.metric("Memory (RSS)", f"{health['rss_mb']:.0f} MB")
+        elif health['peak_rss_mb'] is not None:
+            col_b.metric("Peak memory (RSS)", f"{health['peak_rss_mb']:.0f} MB")
+        else:
+            col_b.metric("Memory (RSS)", "n/a")
+        st.caption(f"Pooled figures: {health['in_use']} in use, {health['idle']} idle, "
+                   f"{health['unreturned']} not returned")
+        
+        history = watchdog.history()
+        if len(history) >= 2:
+            st.line_chart({
+                "Open figures": [s['pyplot_figures'] + s['in_use'] for s in history],
+                "Pooled (idle)": [s['idle'] for s in history]
+            })
+        if watchdog.leak_suspected():
+            st.warning("⚠️ Figures are not being released - memory may keep growing")
 
 # Footer
 st.markdown("---")